@@ -1,104 +1,197 @@
 """Provide constants used in the elfinder api."""
+import sys
+from collections import namedtuple
+from enum import IntEnum
+from types import MappingProxyType
+from typing import Mapping, Tuple
+
+from typing_extensions import Final
+
 # API requests constants
-API_CMD = "cmd"
-API_CONTENT = "content"
-API_CURRENT = "current"
-API_CUT = "cut"
-API_CHUNK = "chunk"
-API_CID = "cid"
-API_DIRS = "dirs[]"
-API_DOWNLOAD = "download"
-API_DST = "dst"
-API_HEIGHT = "height"
-API_INIT = "init"
-API_INTERSECT = "intersect[]"
-API_MAKEDIR = "makedir"
-API_MIMES = "mimes"
-API_NAME = "name"
-API_Q = "q"
-API_RANGE = "range"
-API_SRC = "src"
-API_SUBSTITUTE = "substitute"
-API_TARGET = "target"
-API_TARGETS = "targets[]"
-API_TREE = "tree"
-API_TYPE = "type"
-API_UPLOAD = "upload[]"
-API_UPLOAD_PATH = "upload_path[]"
-API_WIDTH = "width"
+API_CMD: Final[str] = "cmd"
+API_CONTENT: Final[str] = "content"
+API_CURRENT: Final[str] = "current"
+API_CUT: Final[str] = "cut"
+API_CHUNK: Final[str] = "chunk"
+API_CID: Final[str] = "cid"
+API_DIRS: Final[str] = "dirs[]"
+API_DOWNLOAD: Final[str] = "download"
+API_DST: Final[str] = "dst"
+API_HEIGHT: Final[str] = "height"
+API_INIT: Final[str] = "init"
+API_INTERSECT: Final[str] = "intersect[]"
+API_MAKEDIR: Final[str] = "makedir"
+API_MIMES: Final[str] = "mimes"
+API_NAME: Final[str] = "name"
+API_Q: Final[str] = "q"
+API_RANGE: Final[str] = "range"
+API_SRC: Final[str] = "src"
+API_SUBSTITUTE: Final[str] = "substitute"
+API_TARGET: Final[str] = "target"
+API_TARGETS: Final[str] = "targets[]"
+API_TREE: Final[str] = "tree"
+API_TYPE: Final[str] = "type"
+API_UPLOAD: Final[str] = "upload[]"
+API_UPLOAD_PATH: Final[str] = "upload_path[]"
+API_WIDTH: Final[str] = "width"
 
 # Archive constants
-ARCHIVE_ARGC = "argc"
-ARCHIVE_CMD = "cmd"
-ARCHIVE_EXT = "ext"
+ARCHIVE_ARGC: Final[str] = "argc"
+ARCHIVE_CMD: Final[str] = API_CMD  # same literal as the api constant
+ARCHIVE_EXT: Final[str] = "ext"
 
 # Info constants
-INFO_ALIAS = "alias"
-INFO_DIM = "dim"
-INFO_DIRS = "dirs"
-INFO_HASH = "hash"
-INFO_LINK = "link"
-INFO_LOCKED = "locked"
-INFO_MIME = "mime"
-INFO_NAME = "name"
-INFO_PHASH = "phash"
-INFO_READ = "read"
-INFO_RESIZE = "resize"
-INFO_SIZE = "size"
-INFO_TMB = "tmb"
-INFO_TS = "ts"
-INFO_URL = "url"
-INFO_VOLUMEID = "volumeid"
-INFO_WRITE = "write"
+INFO_ALIAS: Final[str] = "alias"
+INFO_DIM: Final[str] = "dim"
+INFO_DIRS: Final[str] = "dirs"
+INFO_HASH: Final[str] = "hash"
+INFO_LINK: Final[str] = "link"
+INFO_LOCKED: Final[str] = "locked"
+INFO_MIME: Final[str] = "mime"
+INFO_NAME: Final[str] = API_NAME  # same literal as the api constant
+INFO_PHASH: Final[str] = "phash"
+INFO_READ: Final[str] = "read"
+INFO_RESIZE: Final[str] = "resize"
+INFO_SIZE: Final[str] = "size"
+INFO_TMB: Final[str] = "tmb"
+INFO_TS: Final[str] = "ts"
+INFO_URL: Final[str] = "url"
+INFO_VOLUMEID: Final[str] = "volumeid"
+INFO_WRITE: Final[str] = "write"
 
 # Response constants
-R_ADDED = "added"
-R_API = "api"
-R_CHANGED = "changed"
-R_CHUNKMERGED = "_chunkmerged"
-R_CWD = "cwd"
-R_DEBUG = "debug"
-R_DIM = "dim"
-R_DIR_CNT = "dirCnt"
-R_ERROR = "error"
-R_FILE_CNT = "fileCnt"
-R_FILES = "files"
-R_HASHES = "hashes"
-R_IMAGES = "images"
-R_LIST = "list"
-R_NAME = "_name"
-R_NETDRIVERS = "netDrivers"
-R_OPTIONS = "options"
-R_REMOVED = "removed"
-R_SIZE = "size"
-R_SIZES = "sizes"
-R_TREE = "tree"
-R_UPLMAXFILE = "uplMaxFile"
-R_UPLMAXSIZE = "uplMaxSize"
-R_WARNING = "warning"
+R_ADDED: Final[str] = "added"
+R_API: Final[str] = "api"
+R_CHANGED: Final[str] = "changed"
+R_CHUNKMERGED: Final[str] = "_chunkmerged"
+R_CWD: Final[str] = "cwd"
+R_DEBUG: Final[str] = "debug"
+R_DIM: Final[str] = INFO_DIM  # same literal as the info constant
+R_DIR_CNT: Final[str] = "dirCnt"
+R_ERROR: Final[str] = "error"
+R_FILE_CNT: Final[str] = "fileCnt"
+R_FILES: Final[str] = "files"
+R_HASHES: Final[str] = "hashes"
+R_IMAGES: Final[str] = "images"
+R_LIST: Final[str] = "list"
+R_NAME: Final[str] = "_name"
+R_NETDRIVERS: Final[str] = "netDrivers"
+R_OPTIONS: Final[str] = "options"
+R_REMOVED: Final[str] = "removed"
+R_SIZE: Final[str] = INFO_SIZE  # same literal as the info constant
+R_SIZES: Final[str] = "sizes"
+R_TREE: Final[str] = API_TREE  # same literal as the api constant
+R_UPLMAXFILE: Final[str] = "uplMaxFile"
+R_UPLMAXSIZE: Final[str] = "uplMaxSize"
+R_WARNING: Final[str] = "warning"
 
 
 # Response options constants
-R_OPTIONS_ARCHIVERS = "archivers"
-R_OPTIONS_COPY_OVERWRITE = "copyOverwrite"
-R_OPTIONS_CREATE = "create"
-R_OPTIONS_CREATE_EXT = "createext"
-R_OPTIONS_DISABLED = "disabled"
-R_OPTIONS_DISP_INLINE_REGEX = "dispInlineRegex"
-R_OPTIONS_EXTRACT = "extract"
-R_OPTIONS_I18N_FOLDER_NAME = "i18nFolderName"
-R_OPTIONS_JPG_QUALITY = "jpgQuality"
-R_OPTIONS_MIME_ALLOW = "allow"
-R_OPTIONS_MIME_DENY = "deny"
-R_OPTIONS_MIME_FIRST_ORDER = "firstOrder"
-R_OPTIONS_PATH = "path"
-R_OPTIONS_SEPARATOR = "separator"
-R_OPTIONS_SYNC_CHK_AS_TS = "syncChkAsTs"
-R_OPTIONS_SYNC_MIN_MS = "syncMinMs"
-R_OPTIONS_TMB_URL = "tmbURL"
-R_OPTIONS_UI_CMD_MAP = "uiCmdMap"
-R_OPTIONS_UPLOAD_MAX_CONN = "uploadMaxConn"
-R_OPTIONS_UPLOAD_MAX_SIZE = "uploadMaxSize"
-R_OPTIONS_UPLOAD_MIME = "uploadMime"
-R_OPTIONS_UPLOAD_OVERWRITE = "uploadOverwrite"
-R_OPTIONS_URL = "url"
+R_OPTIONS_ARCHIVERS: Final[str] = "archivers"
+R_OPTIONS_COPY_OVERWRITE: Final[str] = "copyOverwrite"
+R_OPTIONS_CREATE: Final[str] = "create"
+R_OPTIONS_CREATE_EXT: Final[str] = "createext"
+R_OPTIONS_DISABLED: Final[str] = "disabled"
+R_OPTIONS_DISP_INLINE_REGEX: Final[str] = "dispInlineRegex"
+R_OPTIONS_EXTRACT: Final[str] = "extract"
+R_OPTIONS_I18N_FOLDER_NAME: Final[str] = "i18nFolderName"
+R_OPTIONS_JPG_QUALITY: Final[str] = "jpgQuality"
+R_OPTIONS_MIME_ALLOW: Final[str] = "allow"
+R_OPTIONS_MIME_DENY: Final[str] = "deny"
+R_OPTIONS_MIME_FIRST_ORDER: Final[str] = "firstOrder"
+R_OPTIONS_PATH: Final[str] = "path"
+R_OPTIONS_SEPARATOR: Final[str] = "separator"
+R_OPTIONS_SYNC_CHK_AS_TS: Final[str] = "syncChkAsTs"
+R_OPTIONS_SYNC_MIN_MS: Final[str] = "syncMinMs"
+R_OPTIONS_TMB_URL: Final[str] = "tmbURL"
+R_OPTIONS_UI_CMD_MAP: Final[str] = "uiCmdMap"
+R_OPTIONS_UPLOAD_MAX_CONN: Final[str] = "uploadMaxConn"
+R_OPTIONS_UPLOAD_MAX_SIZE: Final[str] = "uploadMaxSize"
+R_OPTIONS_UPLOAD_MIME: Final[str] = "uploadMime"
+R_OPTIONS_UPLOAD_OVERWRITE: Final[str] = "uploadOverwrite"
+R_OPTIONS_URL: Final[str] = INFO_URL  # same literal as the info constant
+
+_CONSTANT_NAMES = tuple(
+    _name
+    for _name, _value in globals().items()
+    if _name.isupper() and isinstance(_value, str)
+)
+
+# Compile time interning does not cover all the values above,
+# e.g. "upload[]" or "targets[]". Intern every constant
+# so that dict lookups on request and response keys
+# can use the pointer equality fast path.
+globals().update({_name: sys.intern(globals()[_name]) for _name in _CONSTANT_NAMES})
+
+# Integer key schema for hot internal dict use. Hashing an enum member costs
+# an int hash and equality a single compare, while the string constants pay a
+# string hash plus a memcmp. Internal dicts can be keyed by ApiKey and
+# converted back to the canonical strings via KEY_TO_STR at the JSON boundary.
+ApiKey = IntEnum("ApiKey", _CONSTANT_NAMES)  # type: ignore
+
+KEY_TO_STR = MappingProxyType(
+    {_key: globals()[_key.name] for _key in ApiKey}
+)  # type: Mapping[IntEnum, str]
+
+# Different constants may share the same string value, e.g. API_CMD and
+# ARCHIVE_CMD. The first constant defined wins in the inverse mapping.
+STR_TO_KEY = MappingProxyType(
+    {_str: _key for _key, _str in reversed(list(KEY_TO_STR.items()))}
+)  # type: Mapping[str, IntEnum]
+
+# Frozen, slotted view of the whole constant namespace. Attribute access on a
+# namedtuple goes through a fixed index descriptor instead of a module
+# __dict__ lookup, and the instance carries no per-instance __dict__.
+API_CONST = namedtuple("ApiConst", _CONSTANT_NAMES)(
+    *(globals()[_name] for _name in _CONSTANT_NAMES)
+)
+
+# Key groups as frozensets for O(1) membership checks when validating
+# request parameters and response payloads.
+API_KEYS = frozenset(
+    globals()[_name] for _name in _CONSTANT_NAMES if _name.startswith("API_")
+)  # type: frozenset
+ARCHIVE_KEYS = frozenset(
+    globals()[_name] for _name in _CONSTANT_NAMES if _name.startswith("ARCHIVE_")
+)  # type: frozenset
+INFO_KEYS = frozenset(
+    globals()[_name] for _name in _CONSTANT_NAMES if _name.startswith("INFO_")
+)  # type: frozenset
+RESPONSE_KEYS = frozenset(
+    globals()[_name]
+    for _name in _CONSTANT_NAMES
+    if _name.startswith("R_") and not _name.startswith("R_OPTIONS_")
+)  # type: frozenset
+RESPONSE_OPTIONS_KEYS = frozenset(
+    globals()[_name] for _name in _CONSTANT_NAMES if _name.startswith("R_OPTIONS_")
+)  # type: frozenset
+
+# Canonical response key order. Building response dicts by inserting keys in
+# this one order gives every response the same internal dict layout and a
+# stable key order in the serialized JSON.
+RESPONSE_KEY_ORDER = (
+    R_API,
+    R_CWD,
+    R_FILES,
+    R_NETDRIVERS,
+    R_UPLMAXFILE,
+    R_UPLMAXSIZE,
+    R_OPTIONS,
+    R_TREE,
+    R_LIST,
+    R_ADDED,
+    R_CHANGED,
+    R_REMOVED,
+    R_HASHES,
+    R_IMAGES,
+    R_DIM,
+    R_SIZE,
+    R_SIZES,
+    R_DIR_CNT,
+    R_FILE_CNT,
+    R_NAME,
+    R_CHUNKMERGED,
+    R_WARNING,
+    R_ERROR,
+    R_DEBUG,
+)  # type: Final[Tuple[str, ...]]
@@ -13,20 +13,41 @@ import hashlib
 import mimetypes
 import os
 import re
+import secrets
 import shlex
 import shutil
+import stat as fstat
 import subprocess
+import tarfile
 import time
 import traceback
-import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from types import ModuleType
-from typing import Any, BinaryIO, Dict, Generator, List, Optional, Tuple, Union
+from functools import lru_cache
+from types import MappingProxyType, ModuleType
+from typing import (
+    Any,
+    BinaryIO,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
 from urllib.parse import quote, urljoin
 
 from pathvalidate import sanitize_filename, sanitize_filepath
 from typing_extensions import Literal, TypedDict
 
+try:  # Windows needs stdio set for binary mode.
+    import msvcrt
+except ImportError:
+    msvcrt = None  # type: ignore
+
 from .api_const import (
     API_CMD,
     API_CONTENT,
@@ -135,34 +156,55 @@ COMMANDS = {
     "zipdl": "__zipdl",
 }
 
-MIME_TYPES = {
-    # text
-    ".cfg": "text/plain",
-    ".conf": "text/plain",
-    ".css": "text/css",
-    ".htm": "text/html",
-    ".html": "text/html",
-    ".ini": "text/plain",
-    ".java": "text/x-java-source",
-    ".js": "text/javascript",
-    ".md": "text/markdown",
-    ".php": "text/x-php",
-    ".pl": "text/x-perl",
-    ".py": "text/x-python",
-    ".rb": "text/x-ruby",
-    ".rtf": "text/rtf",
-    ".rtfd": "text/rtfd",
-    ".sh": "text/x-shellscript",
-    ".sql": "text/x-sql",
-    ".txt": "text/plain",
-    # apps
-    ".7z": "application/x-7z-compressed",
-    ".doc": "application/msword",
-    ".ogg": "application/ogg",
-    # video
-    ".mkv": "video/x-matroska",
-    ".ogm": "application/ogm",
-}
+# Read-only so every connector shares one mapping and nothing can
+# invalidate the cached mimetype lookups below.
+MIME_TYPES = MappingProxyType(
+    {
+        # text
+        ".cfg": "text/plain",
+        ".conf": "text/plain",
+        ".css": "text/css",
+        ".htm": "text/html",
+        ".html": "text/html",
+        ".ini": "text/plain",
+        ".java": "text/x-java-source",
+        ".js": "text/javascript",
+        ".md": "text/markdown",
+        ".php": "text/x-php",
+        ".pl": "text/x-perl",
+        ".py": "text/x-python",
+        ".rb": "text/x-ruby",
+        ".rtf": "text/rtf",
+        ".rtfd": "text/rtfd",
+        ".sh": "text/x-shellscript",
+        ".sql": "text/x-sql",
+        ".txt": "text/plain",
+        # apps
+        ".7z": "application/x-7z-compressed",
+        ".doc": "application/msword",
+        ".ogg": "application/ogg",
+        # video
+        ".mkv": "video/x-matroska",
+        ".ogm": "application/ogm",
+    }
+)
+
+# Mimetype pattern the client may display inline, sent verbatim with
+# every open response.
+DISP_INLINE_REGEX = (
+    "^(?:(?:image|video|audio)|application/"
+    "(?:x-mpegURL|dash\\+xml)|(?:text/plain|application/pdf)$)"
+)
+
+# Formats the standard library can handle in process when the external
+# archiver binaries are not installed. Maps mime to extension and
+# tarfile mode, where None means zipfile.
+STDLIB_ARCHIVERS = {
+    "application/x-tar": ("tar", "w"),
+    "application/x-gzip": ("tar.gz", "w:gz"),
+    "application/x-bzip2": ("tar.bz2", "w:bz2"),
+    "application/zip": ("zip", None),
+}  # type: Dict[str, Tuple[str, Optional[Literal["w", "w:gz", "w:bz2"]]]]
 
 Archivers = TypedDict(  # pylint: disable=invalid-name
     "Archivers",
@@ -267,11 +309,17 @@ class Connector:
         "upload_max_conn": -1,
         "upload_max_size": 256 * 1024 * 1024,
         "upload_order": ["deny", "allow"],
-        "upload_write_chunk": 8192,
+        "upload_write_chunk": 1024 * 1024,
     }  # type: Options
 
     # The cache needs to be persistent between connector instances.
-    _cached_path = {}  # type: Dict[str, str]
+    # It is kept in insertion order and capped, so the oldest entries
+    # fall out instead of the mapping growing without bound.
+    _cached_path = OrderedDict()  # type: OrderedDict[str, str]
+    _cached_path_max = 8192
+
+    # Result of the archiver probes, shared by all instances.
+    _archivers_detected = None  # type: Optional[Tuple[Archivers, List[str]]]
 
     # public variables
     http_allowed_parameters = (
@@ -312,7 +360,9 @@ class Connector:
         debug: bool = False,
     ) -> None:
         """Set up connector instance."""
-        self.volumeid = str(uuid.uuid4())
+        # A short random token is enough to namespace hashes per volume
+        # and is cheaper to generate than a uuid.
+        self.volumeid = secrets.token_hex(8)
 
         # internal
         self._commands = dict(COMMANDS)
@@ -323,9 +373,12 @@ class Connector:
         self._response[R_DEBUG] = {}
         self._error_data = {}  # type: Dict[str, str]
         self._img = None  # type: Optional[ModuleType]
+        self._img_lib_checked = False
 
         # options
-        self._options["root"] = self._check_utf8(root)
+        # Root is read on nearly every path operation, so keep a direct
+        # reference on the instance next to the shared options dict.
+        self._options["root"] = self._root = self._check_utf8(root)
         self._options["upload_max_size"] = upload_max_size
         self._options["debug"] = debug
         self._options["base_url"] = (
@@ -335,16 +388,50 @@ class Connector:
         self._options["dot_files"] = dot_files
         self._options["files_url"] = self._check_utf8(url).rstrip("/")
 
+        # The root hash and the root prefix lengths are needed on every
+        # find call and url computation, so compute them once up front.
+        self._root_hash = self._hash(self._root)
+        self._root_len = len(self._root)
+        self._norm_root_len = len(os.path.normpath(self._root))
+        self._can_tmb = None  # type: Optional[bool]
+        # Permission rules are static, so pair each compiled pattern
+        # with its permissions once instead of re-reading the dict on
+        # every access check.
+        self._perms = tuple(
+            (_compile_perm(ppath), permissions)
+            for ppath, permissions in self._options["perms"].items()
+        )
+        # The base and files URL parts never change, so pre-strip and
+        # join them once. Absolute base URLs keep the urljoin path.
+        if self._options["base_url"].startswith("http"):
+            self._url_prefix = None  # type: Optional[str]
+        else:
+            self._url_prefix = "/" + "/".join(
+                part.strip("/")
+                for part in (self._options["base_url"], self._options["files_url"])
+                if part
+            )
+
         self._debug("files_url", self._options["files_url"])
-        self._debug("root", self._options["root"])
+        self._debug("root", self._root)
 
         for cmd in self._options["disabled"]:
             if cmd in self._commands:
                 del self._commands[cmd]
 
+        # Resolve the command methods up front so dispatch in run is a
+        # single dict lookup instead of name mangling plus getattr.
+        # Commands without a method, e.g. reload, are left out and get
+        # reported as unknown commands.
+        self._dispatch = {}  # type: Dict[str, Any]
+        for cmd, name in self._commands.items():
+            func = getattr(self, "_" + self.__class__.__name__ + name, None)
+            if func is not None:
+                self._dispatch[cmd] = func
+
         # TODO: Move side effects out of init.
         if tmb_dir:
-            thumbs_dir = os.path.join(self._options["root"], tmb_dir)
+            thumbs_dir = os.path.join(self._root, tmb_dir)
             try:
                 if not os.path.exists(thumbs_dir):
                     os.makedirs(thumbs_dir)  # self._options['tmbDir'] = False
@@ -362,11 +449,14 @@ class Connector:
     ) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
         """Run main function."""
         start_time = time.time()
+        # The thumbnail capability depends on options that commands may
+        # adjust, so re-evaluate it once per request.
+        self._can_tmb = None
         root_ok = True
-        if not os.path.exists(self._options["root"]):
+        if not os.path.exists(self._root):
             root_ok = False
             self._response[R_ERROR] = "Invalid backend configuration"
-        elif not self._is_allowed(self._options["root"], "read"):
+        elif not self._is_allowed(self._root, "read"):
             root_ok = False
             self._response[R_ERROR] = "Access denied"
 
@@ -375,10 +465,8 @@ class Connector:
                 self._request[field] = http_request[field]
 
         if root_ok and API_CMD in self._request:
-            if self._request[API_CMD] in self._commands:
-                cmd = self._commands[self._request[API_CMD]]
-                # A missing command method should blow up here.
-                func = getattr(self, "_" + self.__class__.__name__ + cmd)
+            if self._request[API_CMD] in self._dispatch:
+                func = self._dispatch[self._request[API_CMD]]
 
                 try:
                     func()
@@ -441,7 +529,7 @@ class Connector:
         if init:
             self._response[R_API] = 2.1
             if not path:
-                path = self._options["root"]
+                path = self._root
 
         if not path:
             self._response[R_ERROR] = "File not found"
@@ -454,16 +542,15 @@ class Connector:
         self._cwd(path)
 
         try:
-            items = os.listdir(path)
+            entries = sorted(os.scandir(path), key=lambda entry: entry.name)
         except PermissionError:
             self._response[R_ERROR] = "Access denied"
             return
 
         files = []
-        for item in sorted(items):
-            file_path = os.path.join(path, item)
-            if self._is_accepted(item):
-                info = self._info(file_path)
+        for entry in entries:
+            if self._is_accepted(entry.name):
+                info = self._info(entry.path)
                 files.append(info)
 
         self._response[R_FILES] = files
@@ -511,8 +598,7 @@ class Connector:
                 R_OPTIONS_MIME_FIRST_ORDER: R_OPTIONS_MIME_DENY,
             },
             R_OPTIONS_I18N_FOLDER_NAME: True,
-            R_OPTIONS_DISP_INLINE_REGEX: "^(?:(?:image|video|audio)|application/"
-            + "(?:x-mpegURL|dash\\+xml)|(?:text/plain|application/pdf)$)",
+            R_OPTIONS_DISP_INLINE_REGEX: DISP_INLINE_REGEX,
             R_OPTIONS_JPG_QUALITY: 100,
             R_OPTIONS_SYNC_CHK_AS_TS: 1,
             R_OPTIONS_SYNC_MIN_MS: 30000,
@@ -749,16 +835,12 @@ class Connector:
 
     def __upload(self) -> None:
         """Upload files."""
-        try:  # Windows needs stdio set for binary mode.
-            import msvcrt  # pylint: disable=import-outside-toplevel
-
+        if msvcrt is not None:
             # pylint: disable=no-member
             # stdin  = 0
             # stdout = 1
             msvcrt.setmode(0, os.O_BINARY)  # type: ignore
             msvcrt.setmode(1, os.O_BINARY)  # type: ignore
-        except ImportError:
-            pass
         if API_TARGET in self._request:
             chunk = self._request.get(API_CHUNK)
             self._response[R_ADDED] = []
@@ -920,23 +1002,23 @@ class Connector:
             else:
                 name = os.path.join(target_dir, name)
                 replace = os.path.exists(name)
+                # Check the size limit against the spooled upload before
+                # writing anything to disk.
+                data.file.seek(0, os.SEEK_END)
+                up_size += data.file.tell()
+                data.file.seek(0)
+                if up_size > max_size:
+                    self._response[R_WARNING].append(
+                        "File exceeds the maximum allowed filesize"
+                    )
+                    continue
                 try:
-                    with open(name, "wb", self._options["upload_write_chunk"]) as fil:
-                        for chunk in self._fbuffer(data.file):
-                            fil.write(chunk)
+                    with open(name, "wb") as fil:
+                        shutil.copyfileobj(
+                            data.file, fil, self._options["upload_write_chunk"]
+                        )
 
-                    up_size += os.lstat(name).st_size
-                    if up_size > max_size:
-                        try:
-                            os.unlink(name)
-                            self._response[R_WARNING].append(
-                                "File exceeds the maximum allowed filesize"
-                            )
-                        except OSError:
-                            self._response[R_WARNING].append(
-                                "File was only partially uploaded"
-                            )
-                    elif not self._is_upload_allow(name):
+                    if not self._is_upload_allow(name):
                         self._response[R_WARNING].append("Not allowed file type")
                         try:
                             os.unlink(name)
@@ -950,16 +1032,6 @@ class Connector:
 
                 except OSError:
                     self._response[R_WARNING].append("Unable to save uploaded file")
-                if up_size > max_size:
-                    try:
-                        os.unlink(name)
-                        self._response[R_WARNING].append(
-                            "File exceeds the maximum allowed filesize"
-                        )
-                    except OSError:
-                        self._response[R_WARNING].append(
-                            "File was only partially uploaded"
-                        )
 
     def __paste(self) -> None:
         """Copy or cut files/directories."""
@@ -990,7 +1062,7 @@ class Connector:
                     self._response[R_ERROR] = "File not found"
                     return
                 new_dst = os.path.join(dst, os.path.basename(fil))
-                if dst.find(fil) == 0:
+                if dst == fil or dst.startswith(fil + os.sep):
                     self._response[R_ERROR] = "Unable to copy into itself"
                     return
 
@@ -1080,7 +1152,7 @@ class Connector:
         if not self._is_allowed(cur_file, "write"):
             self._response[R_ERROR] = "Access denied"
             return
-        if _mimetype(cur_file).find("image") != 0:
+        if not _mimetype(cur_file).startswith("image"):
             self._response[R_ERROR] = "File is not an image"
             return
 
@@ -1090,14 +1162,24 @@ class Connector:
 
         try:
             img = self._img.open(cur_file)  # type: ignore
-            img_resized = img.resize(
-                (width, height), self._img.ANTIALIAS  # type: ignore
-            )
-            img_resized.save(cur_file)
+            # Fast IDCT downscale during JPEG decode; no-op for other formats.
+            img.draft("RGB", (width * 2, height * 2))
+            img_resized = img.resize((width, height), self._img.LANCZOS)  # type: ignore
+            # Write to a sibling temp file and swap it in, so a failed
+            # save cannot leave a half-written image behind.
+            tmp_file = cur_file + ".tmp"
+            try:
+                img_resized.save(tmp_file, img.format)
+                os.replace(tmp_file, cur_file)
+            except (OSError, ValueError):
+                if os.path.exists(tmp_file):
+                    os.unlink(tmp_file)
+                raise
             self._rm_tmb(cur_file)
-        except OSError as exc:  # UnidentifiedImageError requires Pillow 7.0.0
+        # UnidentifiedImageError requires Pillow 7.0.0
+        except (OSError, ValueError) as exc:
             # self._debug('resizeFailed_' + path, str(exc))
-            self._debug("resizeFailed_" + self._options["root"], str(exc))
+            self._debug("resizeFailed_" + self._root, str(exc))
             self._response[R_ERROR] = "Unable to resize image"
             return
 
@@ -1118,7 +1200,7 @@ class Connector:
         else:
             tmb_max = 5
         self._response[R_IMAGES] = {}
-        i = 0
+        candidates = []
         for fhash in targets:
             path = self._find(fhash)
             if path is None:
@@ -1127,13 +1209,36 @@ class Connector:
                 continue
             if self._can_create_tmb(path) and self._is_allowed(path, "read"):
                 tmb = os.path.join(thumbs_dir, fhash + ".png")
-                if not os.path.exists(tmb):
-                    if self._tmb(path, tmb):
-                        self._response[R_IMAGES].update({fhash: self._path2url(tmb)})
-                        i += 1
-            if i >= tmb_max:
+                # A thumbnail at least as new as the image is still valid;
+                # regenerate only missing or stale ones.
+                try:
+                    tmb_fresh = os.stat(tmb).st_mtime >= os.lstat(path).st_mtime
+                except OSError:
+                    tmb_fresh = False
+                if not tmb_fresh:
+                    candidates.append((fhash, path, tmb))
+            if len(candidates) >= tmb_max:
                 break
 
+        if not candidates:
+            return
+
+        # Process the sources in path order so reads proceed directory by
+        # directory, making the most of readahead on cold caches. The
+        # response maps by hash, so the order is free to change.
+        candidates.sort(key=lambda candidate: candidate[1])
+
+        # PIL releases the GIL while decoding and resampling, so a small
+        # thread pool overlaps the per-image work.
+        workers = min(len(candidates), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            created = pool.map(
+                lambda candidate: self._tmb(candidate[1], candidate[2]), candidates
+            )
+            for (fhash, _, tmb), success in zip(candidates, created):
+                if success:
+                    self._response[R_IMAGES].update({fhash: self._path2url(tmb)})
+
     def __size(self) -> None:
         if API_TARGETS not in self._request:
             self._response[R_ERROR] = "Invalid parameters"
@@ -1155,21 +1260,24 @@ class Connector:
             file_count = 0
             dir_count = 0
             if os.path.isdir(path):
-                for root, dirs, files in os.walk(path, topdown=True):
-                    for folder in dirs:
-                        folder_path = os.path.join(root, folder)
-                        size = self._dir_size(folder_path)
-                        sizes.append({})
-                        dir_count += 1
-                        total_size += size
-                    for fil in files:
-                        file_path = os.path.join(root, fil)
-                        size = os.stat(file_path).st_size
-                        total_size += size
-                        file_count += 1
-                    break
+                try:
+                    entries = list(os.scandir(path))
+                except OSError:
+                    entries = []
+                for entry in entries:
+                    try:
+                        if entry.is_dir():
+                            size = self._dir_size(entry.path)
+                            sizes.append({})
+                            dir_count += 1
+                            total_size += size
+                        else:
+                            total_size += entry.stat().st_size
+                            file_count += 1
+                    except OSError:
+                        continue
             else:
-                size = os.stat(file_path).st_size
+                size = os.stat(path).st_size
                 total_size += size
                 file_count += 1
             sizes.append(
@@ -1245,21 +1353,20 @@ class Connector:
             self._response[R_ERROR] = "Access denied"
             return
 
+        tree = []
         try:
-            directories = os.listdir(path)
+            with os.scandir(path) as entries:
+                for entry in sorted(entries, key=lambda ent: ent.name):
+                    if (
+                        self._is_accepted(entry.name)
+                        and entry.is_dir()
+                        and not entry.is_symlink()
+                    ):
+                        tree.append(self._info(entry.path))
         except PermissionError:
             self._response[R_ERROR] = "Access denied"
             return
 
-        tree = []
-        for directory in sorted(directories):
-            dir_path = os.path.join(path, directory)
-            if (
-                os.path.isdir(dir_path)
-                and not os.path.islink(dir_path)
-                and self._is_accepted(directory)
-            ):
-                tree.append(self._info(dir_path))
         self._response[R_TREE] = tree
 
     def __get(self) -> None:
@@ -1278,14 +1385,14 @@ class Connector:
             self._response[R_ERROR] = "Access denied"
             return
 
+        # Read the file once as bytes and try to decode in memory, instead
+        # of a text read that re-reads the file on UnicodeDecodeError.
+        with open(cur_file, "rb") as bin_fil:
+            data = bin_fil.read()
         try:
-            with open(cur_file, "r") as text_fil:
-                self._response[API_CONTENT] = text_fil.read()
+            self._response[API_CONTENT] = data.decode("utf-8")
         except UnicodeDecodeError:
-            with open(cur_file, "rb") as bin_fil:
-                self._response[API_CONTENT] = base64.b64encode(bin_fil.read()).decode(
-                    "ascii"
-                )
+            self._response[API_CONTENT] = base64.b64encode(data).decode("ascii")
 
     def __dim(self) -> None:
         target = self._request.get(API_TARGET)
@@ -1329,17 +1436,15 @@ class Connector:
             return
 
         try:
-            if (
-                self._request[API_CONTENT].startswith("data:")
-                and ";base64," in self._request[API_CONTENT][:100]
-            ):
-                img_data = self._request[API_CONTENT].split(";base64,")[1]
-                img_data = base64.b64decode(img_data)
-                with open(cur_file, "wb") as bin_fil:
+            if content.startswith("data:") and ";base64," in content[:100]:
+                img_data = base64.b64decode(content.split(";base64,", 1)[1])
+                # A single unbuffered write avoids copying the decoded
+                # payload through an extra userspace buffer.
+                with open(cur_file, "wb", buffering=0) as bin_fil:
                     bin_fil.write(img_data)
             else:
                 with open(cur_file, "w+") as text_fil:
-                    text_fil.write(self._request[API_CONTENT])
+                    text_fil.write(content)
             self._rm_tmb(cur_file)
             self._response[R_CHANGED] = [self._info(cur_file)]
         except OSError:
@@ -1389,17 +1494,17 @@ class Connector:
         archive_name = _unique_name(archive_name, "")
         archive_path = os.path.join(cur_dir, archive_name)
 
-        cmd = [arc[ARCHIVE_CMD]]
-        for arg in arc[ARCHIVE_ARGC].split():
-            cmd.append(arg)
-        cmd.append(archive_name)
-        for fil in real_files:
-            cmd.append(fil)
+        if "stdlib" in arc:
+            ret = _archive_stdlib(archive_type, archive_path, real_files, cur_dir)
+        else:
+            cmd = [arc[ARCHIVE_CMD]]
+            for arg in arc[ARCHIVE_ARGC].split():
+                cmd.append(arg)
+            cmd.append(archive_name)
+            for fil in real_files:
+                cmd.append(fil)
 
-        cur_cwd = os.getcwd()
-        os.chdir(cur_dir)
-        ret = _run_sub_process(cmd)
-        os.chdir(cur_cwd)
+            ret = _run_sub_process(cmd, cwd=cur_dir)
 
         if not ret:
             self._response[R_ERROR] = "Unable to create archive"
@@ -1434,11 +1539,6 @@ class Connector:
 
         arc = self._options["archivers"]["extract"][mime]
 
-        cmd = [arc[ARCHIVE_CMD]]
-        for arg in arc[ARCHIVE_ARGC].split():
-            cmd.append(arg)
-        cmd.append(os.path.basename(cur_file))
-
         target_dir = cur_dir
         added = None
         if makedir and makedir != "0":
@@ -1450,7 +1550,6 @@ class Connector:
             except OSError:
                 self._response[R_ERROR] = "Unable to create folder: " + base_name
                 return
-            cmd += shlex.split(arc["argd"].format(shlex.quote(target_dir)))
             added = [self._info(target_dir)]
 
         if added is None:
@@ -1463,10 +1562,17 @@ class Connector:
                 self._response[R_ERROR] = "Access denied"
                 return
 
-        cur_cwd = os.getcwd()
-        os.chdir(cur_dir)
-        ret = _run_sub_process(cmd)
-        os.chdir(cur_cwd)
+        if "stdlib" in arc:
+            ret = _extract_stdlib(cur_file, target_dir)
+        else:
+            cmd = [arc[ARCHIVE_CMD]]
+            for arg in arc[ARCHIVE_ARGC].split():
+                cmd.append(arg)
+            cmd.append(os.path.basename(cur_file))
+            if added is not None:
+                cmd += shlex.split(arc["argd"].format(shlex.quote(target_dir)))
+
+            ret = _run_sub_process(cmd, cwd=cur_dir)
         if not ret:
             self._response[R_ERROR] = "Unable to extract files from archive"
             return
@@ -1497,36 +1603,48 @@ class Connector:
                 return
             search_path = self._find_dir(target)
         else:
-            search_path = self._options["root"]
+            search_path = self._root
 
         if not search_path:
             self._response[R_ERROR] = "File not found"
             return
 
         mimes = self._request.get(API_MIMES)
+        if mimes is not None:
+            mimes = set(mimes)
 
         result = []
-        query = self._request[API_Q]
-        for root, dirs, files in os.walk(search_path):
-            for fil in files:
-                if query.lower() in fil.lower():
-                    file_path = os.path.join(root, fil)
-                    if mimes is None:
-                        result.append(self._info(file_path))
-                    else:
-                        if _mimetype(file_path) in mimes:
-                            result.append(self._info(file_path))
-            if mimes is None:
-                for folder in dirs:
-                    file_path = os.path.join(root, folder)
-                    if query.lower() in folder.lower():
-                        result.append(self._info(file_path))
+        # Fold the query once instead of per entry, and only consult the
+        # mime table for names that already match.
+        query = self._request[API_Q].casefold()
+        # Walk the tree depth first with an explicit stack, so each
+        # directory costs one scandir call and no recursion.
+        stack = [search_path]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = list(os.scandir(current))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if is_dir:
+                    if mimes is None and query in entry.name.casefold():
+                        result.append(self._info(entry.path))
+                    if not entry.is_symlink():
+                        stack.append(entry.path)
+                elif query in entry.name.casefold():
+                    if mimes is None or _mimetype(entry.path) in mimes:
+                        result.append(self._info(entry.path))
         self._response[R_FILES] = result
 
     def _cwd(self, path: str) -> None:
         """Get Current Working Directory."""
         name = os.path.basename(path)
-        if path == self._options["root"]:
+        if path == self._root:
             name = self._options["root_alias"]
             root = True
         else:
@@ -1535,15 +1653,17 @@ class Connector:
         if self._options["root_alias"]:
             basename = self._options["root_alias"]
         else:
-            basename = os.path.basename(self._options["root"])
+            basename = os.path.basename(self._root)
 
-        rel = os.path.join(basename, path[len(self._options["root"]) :])
+        rel = os.path.join(basename, path[self._root_len :])
 
         info = {
             "hash": self._hash(path),
-            "name": self._check_utf8(name),
+            # name and rel are built from str paths, so there is no
+            # bytes input to coerce here.
+            "name": name,
             "mime": "directory",
-            "rel": self._check_utf8(rel),
+            "rel": rel,
             "size": 0,
             "date": datetime.fromtimestamp(os.stat(path).st_mtime).strftime(
                 "%d %b %Y %H:%M"
@@ -1555,30 +1675,35 @@ class Connector:
             "volumeid": self.volumeid,
         }
 
-        try:
-            info["dirs"] = 1 if any(next(os.walk(path))[1]) else 0
-        except StopIteration:
-            info["dirs"] = 0
+        info["dirs"] = 1 if _has_subdirs(path) else 0
 
         self._response[R_CWD] = info
 
     def _info(self, path: str) -> Info:
-        # mime = ''
+        # A single lstat gives both the file type and the metadata,
+        # instead of separate isfile/isdir/islink probes that each
+        # stat the path again.
+        stat = os.lstat(path)
         filetype = "file"
-        if os.path.isfile(path):
-            filetype = "file"
-        elif os.path.isdir(path):
+        if fstat.S_ISLNK(stat.st_mode):
+            target_mode = None  # type: Optional[int]
+            try:
+                target_mode = os.stat(path).st_mode
+            except OSError:
+                pass
+            if target_mode is not None and fstat.S_ISDIR(target_mode):
+                filetype = "dir"
+            elif target_mode is None or not fstat.S_ISREG(target_mode):
+                filetype = "link"
+        elif fstat.S_ISDIR(stat.st_mode):
             filetype = "dir"
-        elif os.path.islink(path):
-            filetype = "link"
 
-        stat = os.lstat(path)
         readable = self._is_allowed(path, "read")
         writable = self._is_allowed(path, "write")
         deletable = self._is_allowed(path, "rm")
 
         info = {
-            "name": self._check_utf8(os.path.basename(path)),
+            "name": os.path.basename(path),
             "hash": self._hash(path),
             "mime": "directory" if filetype == "dir" else _mimetype(path),
             "read": 1 if readable else 0,
@@ -1592,12 +1717,9 @@ class Connector:
 
         if filetype == "dir":
             info["volumeid"] = self.volumeid
-            try:
-                info["dirs"] = 1 if any(next(os.walk(path))[1]) else 0
-            except StopIteration:
-                info["dirs"] = 0
+            info["dirs"] = 1 if _has_subdirs(path) else 0
 
-        if path != self._options["root"]:
+        if path != self._root:
             info["phash"] = self._hash(os.path.dirname(path))
 
         if filetype == "link":
@@ -1614,10 +1736,10 @@ class Connector:
             if self._options["root_alias"]:
                 basename = self._options["root_alias"]
             else:
-                basename = os.path.basename(self._options["root"])
+                basename = os.path.basename(self._root)
 
             info["link"] = self._hash(lpath)
-            info["alias"] = os.path.join(basename, lpath[len(self._options["root"]) :])
+            info["alias"] = os.path.join(basename, lpath[self._root_len :])
             info["read"] = 1 if info["read"] and self._is_allowed(lpath, "read") else 0
             info["write"] = (
                 1 if info["write"] and self._is_allowed(lpath, "write") else 0
@@ -1642,7 +1764,7 @@ class Connector:
                     info["url"] = self._path2url(lpath)
                 else:
                     info["url"] = self._path2url(path)
-            if info["mime"][0:5] == "image":
+            if info["mime"].startswith("image"):
                 thumbs_dir = self._options["tmb_dir"]
                 if self._can_create_tmb():
                     assert thumbs_dir  # typing
@@ -1682,22 +1804,55 @@ class Connector:
             except OSError:
                 self._set_error_data(target, "Remove failed")
                 return False
-        else:
-            try:
-                targets = os.listdir(target)
-            except PermissionError:
-                self._set_error_data(target, "Access denied")
-                return False
 
-            for fil in targets:
-                if self._is_accepted(fil):
-                    self._remove(os.path.join(target, fil))
+        # With dotfile filtering off and no thumbnail cache to clean up
+        # per file, nothing is skipped during the walk, so the whole
+        # subtree can go through the C-accelerated shutil.rmtree.
+        if self._options["dot_files"] and not self._can_create_tmb():
+            errors = []  # type: List[str]
+            shutil.rmtree(target, onerror=lambda _f, p, _e: errors.append(p))
+            for failed in errors:
+                self._set_error_data(failed, "Remove failed")
+            return not errors
+
+        # Delete the tree depth first with an explicit stack. Each
+        # directory is read once with scandir and removed after its
+        # entries are gone. Entries filtered out by _is_accepted are
+        # kept, which makes the final rmdir fail like the recursive
+        # version did.
+        result = True
+        stack = [(target, False)]
+        while stack:
+            path, expanded = stack.pop()
+            if expanded:
+                try:
+                    os.rmdir(path)
+                except OSError:
+                    self._set_error_data(path, "Remove failed")
+                    result = False
+                continue
             try:
-                os.rmdir(target)
-                return True
-            except OSError:
-                self._set_error_data(target, "Remove failed")
-                return False
+                entries = list(os.scandir(path))
+            except PermissionError:
+                self._set_error_data(path, "Access denied")
+                result = False
+                continue
+            stack.append((path, True))
+            for entry in entries:
+                if not self._is_accepted(entry.name):
+                    continue
+                if not self._is_allowed(entry.path, "rm"):
+                    self._set_error_data(entry.path, "Access denied")
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append((entry.path, False))
+                else:
+                    try:
+                        os.unlink(entry.path)
+                        self._rm_tmb(entry.path)
+                    except OSError:
+                        self._set_error_data(entry.path, "Remove failed")
+                        result = False
+        return result
 
     def _copy(self, src: str, dst: str) -> bool:
         """Provide internal copy procedure."""
@@ -1728,16 +1883,15 @@ class Connector:
                 return False
 
             try:
-                srcs = os.listdir(src)
+                srcs = list(os.scandir(src))
             except PermissionError:
                 self._set_error_data(src, "Access denied")
                 return False
 
-            for i in srcs:
-                new_src = os.path.join(src, i)
-                new_dst = os.path.join(dst, i)
-                if not self._copy(new_src, new_dst):
-                    self._set_error_data(new_src, "Unable to copy files")
+            for entry in srcs:
+                new_dst = os.path.join(dst, entry.name)
+                if not self._copy(entry.path, new_dst):
+                    self._set_error_data(entry.path, "Unable to copy files")
                     return False
 
         return True
@@ -1745,56 +1899,71 @@ class Connector:
     def _find_dir(self, fhash: str, path: Optional[str] = None) -> Optional[str]:
         """Find directory by hash."""
         fhash = str(fhash)
-        # try to get find it in the cache
+        # The hash-to-path cache acts as the index, primed by every walk.
+        # Validate hits so renamed or removed directories fall back to a walk.
         cached_path = self._cached_path.get(fhash)
-        if cached_path:
+        if cached_path and os.path.isdir(cached_path):
             return cached_path
 
         if not path:
-            path = self._options["root"]
-            if fhash == self._hash(path):
+            path = self._root
+            if fhash == self._root_hash:
                 return path
 
         if not os.path.isdir(path):
             return None
 
-        for root, dirs, _ in os.walk(path, topdown=True):
-            for folder in dirs:
-                folder_path = os.path.join(root, folder)
-                if not os.path.islink(folder_path) and fhash == self._hash(folder_path):
-                    return folder_path
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = list(os.scandir(current))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if fhash == self._hash(entry.path):
+                        return entry.path
+                    stack.append(entry.path)
         return None
 
     def _find(self, fhash: str, parent: Optional[str] = None) -> Optional[str]:
         """Find file/dir by hash."""
         fhash = str(fhash)
         cached_path = self._cached_path.get(fhash)
-        if cached_path:
+        if cached_path and os.path.lexists(cached_path):
             return cached_path
         if not parent:
-            parent = self._options["root"]
+            parent = self._root
         if os.path.isdir(parent):
-            for root, dirs, files in os.walk(parent, topdown=True):
-                for folder in dirs:
-                    folder_path = os.path.join(root, folder)
-                    if fhash == self._hash(folder_path):
-                        return folder_path
-                for fil in files:
-                    file_path = os.path.join(root, fil)
-                    if fhash == self._hash(file_path):
-                        return file_path
+            stack = [parent]
+            while stack:
+                current = stack.pop()
+                try:
+                    entries = list(os.scandir(current))
+                except OSError:
+                    continue
+                for entry in entries:
+                    if fhash == self._hash(entry.path):
+                        return entry.path
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
 
         return None
 
     def _tmb(self, path: str, tmb_path: str) -> bool:
         """Provide internal thumbnail create procedure."""
         try:
-            img = self._img.open(path).copy()  # type: ignore
+            img = self._img.open(path)  # type: ignore
             size = self._options["tmb_size"], self._options["tmb_size"]
+            # Let the JPEG decoder downscale during decode. Keep twice the
+            # target size so the final thumbnail pass still has detail to
+            # resample from. This is a no-op for other formats.
+            img.draft("RGB", (size[0] * 2, size[1] * 2))
             box = _crop_tuple(img.size)
             if box:
                 img = img.crop(box)
-            img.thumbnail(size, self._img.ANTIALIAS)  # type: ignore
+            img.thumbnail(size, self._img.LANCZOS)  # type: ignore
             img.save(tmb_path, "PNG")
         # UnidentifiedImageError requires Pillow 7.0.0
         except (OSError, ValueError) as exc:
@@ -1818,18 +1987,28 @@ class Connector:
             target = os.path.join(os.path.dirname(path), target)
         target = os.path.normpath(target)
         if os.path.exists(target):
-            if not target.find(self._options["root"]) == -1:
+            if self._root in target:
                 return target
         return None
 
     def _dir_size(self, path: str) -> int:
         total_size = 0
         if self._options["dir_size"]:
-            for dirpath, _, filenames in os.walk(path):
-                for fil in filenames:
-                    file_path = os.path.join(dirpath, fil)
-                    if os.path.exists(file_path):
-                        total_size += os.stat(file_path).st_size
+            stack = [path]
+            while stack:
+                current = stack.pop()
+                try:
+                    entries = list(os.scandir(current))
+                except OSError:
+                    continue
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+                        elif entry.is_file():
+                            total_size += entry.stat().st_size
+                    except OSError:
+                        continue
         else:
             total_size = os.lstat(path).st_size
         return total_size
@@ -1845,13 +2024,13 @@ class Connector:
             yield chunk
 
     def _can_create_tmb(self, path: Optional[str] = None) -> bool:
-        if self._options["img_lib"] and self._options["tmb_dir"]:
-            if path is not None:
-                mime = _mimetype(path)
-                if mime[0:5] != "image":
-                    return False
-            return True
-        return False
+        if self._can_tmb is None:
+            self._can_tmb = bool(self._options["img_lib"] and self._options["tmb_dir"])
+        if not self._can_tmb:
+            return False
+        if path is not None and not _mimetype(path).startswith("image"):
+            return False
+        return True
 
     def _tmb_path(self, path: str) -> Optional[str]:
         tmb = None
@@ -1869,16 +2048,13 @@ class Connector:
         if "all" in self._options["upload_allow"]:
             allow = True
         else:
-            for opt in self._options["upload_allow"]:
-                if mime.find(opt) == 0:
-                    allow = True
+            # startswith with a tuple checks all prefixes in one C-level call.
+            allow = mime.startswith(tuple(self._options["upload_allow"]))
 
         if "all" in self._options["upload_deny"]:
             deny = True
         else:
-            for opt in self._options["upload_deny"]:
-                if mime.find(opt) == 0:
-                    deny = True
+            deny = mime.startswith(tuple(self._options["upload_deny"]))
 
         if self._options["upload_order"][0] == "allow":  # ,deny
             if deny is True:
@@ -1898,29 +2074,26 @@ class Connector:
             return False
         return True
 
+    _access_modes = {"read": os.R_OK, "write": os.W_OK, "rm": os.W_OK}
+
     def _is_allowed(self, path: str, access: str) -> bool:
-        if not os.path.exists(path):
+        mode = self._access_modes.get(access)
+        if mode is None:
             return False
 
-        if access == "read":
-            if not os.access(path, os.R_OK):
+        # A single os.access covers both checks on the common success path:
+        # it only succeeds for paths that exist.
+        check_path = os.path.dirname(path) if access == "rm" else path
+        if not os.access(check_path, mode):
+            if os.path.exists(path):
                 self._set_error_data(path, access)
-                return False
-        elif access == "write":
-            if not os.access(path, os.W_OK):
-                self._set_error_data(path, access)
-                return False
-        elif access == "rm":
-            if not os.access(os.path.dirname(path), os.W_OK):
-                self._set_error_data(path, access)
-                return False
-        else:
+            return False
+        if access == "rm" and not os.path.exists(path):
             return False
 
-        path = path[len(os.path.normpath(self._options["root"])) :]
-        for ppath, permissions in self._options["perms"].items():
-            regex = r"" + ppath
-            if re.search(regex, path) and access in permissions:
+        path = path[self._norm_root_len :]
+        for regex, permissions in self._perms:
+            if access in permissions and regex.search(path):
                 return permissions[access]
 
         return self._options["defaults"][access]
@@ -1929,27 +2102,56 @@ class Connector:
         """Hash of the path."""
         hash_code = make_hash(path)
 
-        # TODO: what if the cache getting to big?  # pylint: disable=fixme
-        self._cached_path[hash_code] = path
+        # The cache is shared across the server's worker threads, so
+        # each step must tolerate concurrent eviction: pop-then-insert
+        # refreshes the entry's position without a separate move_to_end
+        # that could race, and a parallel popitem may find the dict
+        # already drained.
+        cached = self._cached_path
+        cached.pop(hash_code, None)
+        cached[hash_code] = path
+        if len(cached) > self._cached_path_max:
+            try:
+                cached.popitem(last=False)
+            except KeyError:
+                pass
         return hash_code
 
     def _path2url(self, path: str) -> str:
-        cur_dir = path
-        length = len(self._options["root"])
-        url = multi_urljoin(
-            self._options["base_url"],
-            self._options["files_url"],
-            cur_dir[length:],
-        )
-        url = self._check_utf8(url).replace(os.sep, "/")
-        url = quote(url, safe="/")
-        return url
+        suffix = path[self._root_len :]
+        if self._url_prefix is None:
+            url = multi_urljoin(
+                self._options["base_url"],
+                self._options["files_url"],
+                suffix,
+            )
+        else:
+            suffix = suffix.strip("/")
+            if not suffix:
+                url = self._url_prefix
+            elif self._url_prefix == "/":
+                url = "/" + suffix
+            else:
+                url = self._url_prefix + "/" + suffix
+        # multi_urljoin always returns str, so no utf-8 coercion is
+        # needed, and the separator swap only matters off posix.
+        if os.sep != "/":
+            url = url.replace(os.sep, "/")
+        # Quoting per segment caches the repeated directory components
+        # of a listing; joining with "/" matches quote(url, safe="/").
+        return "/".join(_quote_segment(seg) for seg in url.split("/"))
 
     def _set_error_data(self, path: str, msg: str) -> None:
         """Collect error/warning messages."""
         self._error_data[path] = msg
 
     def _init_img_lib(self) -> Optional[str]:
+        # The import outcome cannot change within the process, so only
+        # resolve the library once per instance.
+        if self._img_lib_checked:
+            return self._options["img_lib"]
+        self._img_lib_checked = True
+
         if not self._options["img_lib"] or self._options["img_lib"] == "auto":
             self._options["img_lib"] = "PIL"
 
@@ -1972,8 +2174,11 @@ class Connector:
             return None
         if self._can_create_tmb():
             try:
-                img = self._img.open(path)  # type: ignore
-                return str(img.size[0]) + "x" + str(img.size[1])
+                # Image.open only reads the header for the size probe;
+                # the context manager releases the file handle right away.
+                with self._img.open(path) as img:  # type: ignore
+                    width, height = img.size
+                return str(width) + "x" + str(height)
             except OSError:  # UnidentifiedImageError requires Pillow 7.0.0
                 print("WARNING: unidentified image or file not found: " + path)
 
@@ -1999,16 +2204,28 @@ class Connector:
             self._options["archivers"] = archive
             return
 
-        tar = _run_sub_process(["tar", "--version"])
-        gzip = _run_sub_process(["gzip", "--version"])
-        bzip2 = _run_sub_process(["bzip2", "--version"])
-        zipc = _run_sub_process(["zip", "--version"])
-        unzip = _run_sub_process(["unzip", "--help"])
-        rar = _run_sub_process(["rar", "--version"], valid_return=[0, 7])
-        unrar = _run_sub_process(["unrar"], valid_return=[0, 7])
-        p7z = _run_sub_process(["7z", "--help"])
-        p7za = _run_sub_process(["7za", "--help"])
-        p7zr = _run_sub_process(["7zr", "--help"])
+        # Which archivers exist depends only on PATH, which is stable for
+        # the process, so probe once and reuse the result.
+        cached = Connector._archivers_detected
+        if cached is not None:
+            archive, default_mimes = cached
+            if not self._options["archive_mimes"]:
+                self._options["archive_mimes"] = list(default_mimes)
+            self._options["archivers"] = archive
+            return
+
+        # A PATH lookup answers the existence question as well as running
+        # each binary does, without any fork+exec.
+        tar = shutil.which("tar") is not None
+        gzip = shutil.which("gzip") is not None
+        bzip2 = shutil.which("bzip2") is not None
+        zipc = shutil.which("zip") is not None
+        unzip = shutil.which("unzip") is not None
+        rar = shutil.which("rar") is not None
+        unrar = shutil.which("unrar") is not None
+        p7z = shutil.which("7z") is not None
+        p7za = shutil.which("7za") is not None
+        p7zr = shutil.which("7zr") is not None
 
         # tar = False
         # tar = gzip = bzip2 = zipc = unzip = rar = unrar = False
@@ -2152,101 +2369,88 @@ class Connector:
             )
 
             mime = "application/x-tar"
-            if mime not in create:
-                create.update(
-                    {
-                        mime: {
-                            ARCHIVE_CMD: p7zip,
-                            ARCHIVE_ARGC: "a -ttar",
-                            ARCHIVE_EXT: "tar",
-                        }
-                    }
-                )
-            if mime not in extract:
-                extract.update(
-                    {
-                        mime: {
-                            ARCHIVE_CMD: p7zip,
-                            ARCHIVE_ARGC: "extract -y",
-                            ARCHIVE_EXT: "tar",
-                            "argd": "-o{}",
-                        }
-                    }
-                )
+            create.setdefault(
+                mime,
+                {ARCHIVE_CMD: p7zip, ARCHIVE_ARGC: "a -ttar", ARCHIVE_EXT: "tar"},
+            )
+            extract.setdefault(
+                mime,
+                {
+                    ARCHIVE_CMD: p7zip,
+                    ARCHIVE_ARGC: "extract -y",
+                    ARCHIVE_EXT: "tar",
+                    "argd": "-o{}",
+                },
+            )
 
             mime = "application/x-gzip"
-            if mime not in create:
-                create.update(
-                    {
-                        mime: {
-                            ARCHIVE_CMD: p7zip,
-                            ARCHIVE_ARGC: "a -tgzip",
-                            ARCHIVE_EXT: "gz",
-                        }
-                    }
-                )
-            if mime not in extract:
-                extract.update(
-                    {
-                        mime: {
-                            ARCHIVE_CMD: p7zip,
-                            ARCHIVE_ARGC: "extract -y",
-                            ARCHIVE_EXT: "tar.gz",
-                            "argd": "-o{}",
-                        }
-                    }
-                )
+            create.setdefault(
+                mime,
+                {ARCHIVE_CMD: p7zip, ARCHIVE_ARGC: "a -tgzip", ARCHIVE_EXT: "gz"},
+            )
+            extract.setdefault(
+                mime,
+                {
+                    ARCHIVE_CMD: p7zip,
+                    ARCHIVE_ARGC: "extract -y",
+                    ARCHIVE_EXT: "tar.gz",
+                    "argd": "-o{}",
+                },
+            )
 
             mime = "application/x-bzip2"
-            if mime not in create:
-                create.update(
-                    {
-                        mime: {
-                            ARCHIVE_CMD: p7zip,
-                            ARCHIVE_ARGC: "a -tbzip2",
-                            ARCHIVE_EXT: "bz2",
-                        }
-                    }
-                )
-            if mime not in extract:
-                extract.update(
-                    {
-                        mime: {
-                            ARCHIVE_CMD: p7zip,
-                            ARCHIVE_ARGC: "extract -y",
-                            ARCHIVE_EXT: "tar.bz2",
-                            "argd": "-o{}",
-                        }
-                    }
-                )
+            create.setdefault(
+                mime,
+                {ARCHIVE_CMD: p7zip, ARCHIVE_ARGC: "a -tbzip2", ARCHIVE_EXT: "bz2"},
+            )
+            extract.setdefault(
+                mime,
+                {
+                    ARCHIVE_CMD: p7zip,
+                    ARCHIVE_ARGC: "extract -y",
+                    ARCHIVE_EXT: "tar.bz2",
+                    "argd": "-o{}",
+                },
+            )
 
             mime = "application/zip"
+            create.setdefault(
+                mime,
+                {ARCHIVE_CMD: p7zip, ARCHIVE_ARGC: "a -tzip", ARCHIVE_EXT: "zip"},
+            )
+            extract.setdefault(
+                mime,
+                {
+                    ARCHIVE_CMD: p7zip,
+                    ARCHIVE_ARGC: "extract -y",
+                    ARCHIVE_EXT: "zip",
+                    "argd": "-o{}",
+                },
+            )
+
+        # Cover the common formats in process with zipfile/tarfile when
+        # the external binaries are missing, so archiving keeps working
+        # on hosts without tar or zip installed.
+        for mime, (ext, _) in STDLIB_ARCHIVERS.items():
             if mime not in create:
-                create.update(
-                    {
-                        mime: {
-                            ARCHIVE_CMD: p7zip,
-                            ARCHIVE_ARGC: "a -tzip",
-                            ARCHIVE_EXT: "zip",
-                        }
-                    }
-                )
+                create[mime] = {
+                    ARCHIVE_CMD: "",
+                    ARCHIVE_ARGC: "",
+                    ARCHIVE_EXT: ext,
+                    "stdlib": "1",
+                }
             if mime not in extract:
-                extract.update(
-                    {
-                        mime: {
-                            ARCHIVE_CMD: p7zip,
-                            ARCHIVE_ARGC: "extract -y",
-                            ARCHIVE_EXT: "zip",
-                            "argd": "-o{}",
-                        }
-                    }
-                )
+                extract[mime] = {
+                    ARCHIVE_CMD: "",
+                    ARCHIVE_ARGC: "",
+                    ARCHIVE_EXT: ext,
+                    "argd": "",
+                    "stdlib": "1",
+                }
 
+        Connector._archivers_detected = (archive, list(create.keys()))
         if not self._options["archive_mimes"]:
             self._options["archive_mimes"] = list(create.keys())
-        else:
-            pass
         self._options["archivers"] = archive
 
     def _check_utf8(self, name: Union[str, bytes]) -> str:
@@ -2260,13 +2464,17 @@ class Connector:
         return str_name
 
 
+@lru_cache(maxsize=4096)
 def _check_name(filename: str) -> bool:
     """Check for valid file name."""
+    # sanitize_filename re-parses its input on every call,
+    # so cache the verdict per name.
     if sanitize_filename(filename) != filename:
         return False
     return True
 
 
+@lru_cache(maxsize=4096)
 def _check_dir(filepath: str) -> bool:
     """Check for valid dir name."""
     if sanitize_filepath(filepath) != filepath:
@@ -2274,6 +2482,25 @@ def _check_dir(filepath: str) -> bool:
     return True
 
 
+@lru_cache(maxsize=256)
+def _compile_perm(pattern: str) -> Pattern:
+    """Compile a permission path pattern, caching the result."""
+    return re.compile(pattern)
+
+
+def _has_subdirs(path: str) -> bool:
+    """Check if the directory has at least one subdirectory."""
+    # Stop at the first hit instead of stating the whole directory
+    # the way an os.walk probe would.
+    try:
+        with os.scandir(path) as entries:
+            # Plain is_dir matches os.walk, which also counts symlinked dirs.
+            return any(entry.is_dir() for entry in entries)
+    except OSError:
+        return False
+
+
+@lru_cache(maxsize=65536)
 def _mimetype(path: str) -> str:
     """Detect mimetype of file."""
     mime = mimetypes.guess_type(path)[0] or "unknown"
@@ -2297,6 +2524,32 @@ def _mimetype(path: str) -> str:
     return mime
 
 
+@lru_cache(maxsize=4096)
+def _quote_segment(segment: str) -> str:
+    """Quote a single url path segment, caching the result."""
+    return quote(segment, safe="")
+
+
+def _has_archive_tail(name: str) -> bool:
+    """Check for an archive name like name.tar.gz with an inner extension."""
+    # Same shape as the regex \..{3}\.(gz|bz|bz2)$, tested with plain
+    # string operations: a three character inner extension between two
+    # dots, followed by a compression suffix.
+    if name.endswith((".gz", ".bz")):
+        return len(name) >= 7 and name[-7] == "."
+    if name.endswith(".bz2"):
+        return len(name) >= 8 and name[-8] == "."
+    return False
+
+
+@lru_cache(maxsize=8)
+def _copy_suffix_re(copy: str) -> Pattern:
+    """Compile the indexed-copy suffix pattern for a copy marker."""
+    # Escape the marker: it is configurable and must match literally
+    # even if it contains regex metacharacters.
+    return re.compile(re.escape(copy) + r"\s\d+$")
+
+
 def _unique_name(path: str, copy: str = " copy") -> str:
     """Generate unique name for file copied file."""
     cur_dir = os.path.dirname(path)
@@ -2304,7 +2557,7 @@ def _unique_name(path: str, copy: str = " copy") -> str:
     last_dot = cur_name.rfind(".")
     ext = new_name = ""
 
-    if not os.path.isdir(path) and re.search(r"\..{3}\.(gz|bz|bz2)$", cur_name):
+    if not os.path.isdir(path) and _has_archive_tail(cur_name):
         pos = -7
         if cur_name[-1:] == "2":
             pos -= 1
@@ -2323,7 +2576,7 @@ def _unique_name(path: str, copy: str = " copy") -> str:
 
     if old_name[-len(copy) :] == copy:
         new_name = old_name
-    elif re.search(r"" + copy + r"\s\d+$", old_name):
+    elif _copy_suffix_re(copy).search(old_name):
         pos = old_name.rfind(copy) + len(copy)
         new_name = old_name[0:pos]
     else:
@@ -2336,21 +2589,110 @@ def _unique_name(path: str, copy: str = " copy") -> str:
     idx = 1
     if pos > 0:
         idx = int(old_name[pos:])
+    # One directory read replaces a stat syscall per tried index.
+    try:
+        existing = set(os.listdir(cur_dir or "."))
+    except OSError:
+        existing = set()
     while True:
         idx += 1
         new_name_ext = new_name + " " + str(idx) + ext
-        new_path = os.path.join(cur_dir, new_name_ext)
-        if not os.path.exists(new_path):
-            return new_path
+        if new_name_ext not in existing:
+            return os.path.join(cur_dir, new_name_ext)
         # if idx >= 1000: break # possible loop
 
 
-def _run_sub_process(cmd: List[str], valid_return: Optional[List[int]] = None) -> bool:
+def _archive_stdlib(
+    mime: str, archive_path: str, files: List[str], cur_dir: str
+) -> bool:
+    """Create an archive in process with zipfile/tarfile."""
+    _, tar_mode = STDLIB_ARCHIVERS[mime]
+    try:
+        if tar_mode is None:
+            with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_DEFLATED) as zip_fil:
+                for name in files:
+                    full_path = os.path.join(cur_dir, name)
+                    if os.path.isdir(full_path):
+                        for root, _, fnames in os.walk(full_path):
+                            zip_fil.write(root, os.path.relpath(root, cur_dir))
+                            for fname in fnames:
+                                file_path = os.path.join(root, fname)
+                                zip_fil.write(
+                                    file_path, os.path.relpath(file_path, cur_dir)
+                                )
+                    else:
+                        zip_fil.write(full_path, name)
+        else:
+            with tarfile.open(archive_path, tar_mode) as tar_fil:
+                for name in files:
+                    tar_fil.add(os.path.join(cur_dir, name), arcname=name)
+    except OSError:
+        return False
+    return True
+
+
+def _tar_member_is_safe(member: tarfile.TarInfo, target_dir: str) -> bool:
+    """Check that a tar member extracts inside the target directory."""
+    base = os.path.abspath(target_dir)
+    dest = os.path.abspath(os.path.join(base, member.name))
+    if dest != base and not dest.startswith(base + os.sep):
+        return False
+    if member.issym() or member.islnk():
+        if os.path.isabs(member.linkname):
+            return False
+        if member.issym():
+            # Symlink targets resolve relative to the member's directory.
+            link_dest = os.path.join(os.path.dirname(dest), member.linkname)
+        else:
+            link_dest = os.path.join(base, member.linkname)
+        link_dest = os.path.abspath(link_dest)
+        if link_dest != base and not link_dest.startswith(base + os.sep):
+            return False
+    return True
+
+
+def _extract_stdlib(archive_path: str, target_dir: str) -> bool:
+    """Extract an archive in process with zipfile/tarfile."""
+    try:
+        if zipfile.is_zipfile(archive_path):
+            # ZipFile.extract already sanitizes absolute and dot-dot
+            # member names.
+            with zipfile.ZipFile(archive_path) as zip_fil:
+                zip_fil.extractall(target_dir)
+        else:
+            with tarfile.open(archive_path) as tar_fil:
+                members = tar_fil.getmembers()
+                # The external tar refuses members that escape the
+                # target directory; enforce the same here.
+                if not all(
+                    _tar_member_is_safe(member, target_dir) for member in members
+                ):
+                    return False
+                tar_fil.extractall(target_dir, members)
+    except (OSError, zipfile.BadZipFile, tarfile.TarError):
+        return False
+    return True
+
+
+def _run_sub_process(
+    cmd: List[str],
+    valid_return: Optional[List[int]] = None,
+    cwd: Optional[str] = None,
+) -> bool:
     if valid_return is None:
         valid_return = [0]
+    # A missing binary would only fail inside fork+exec; answer that
+    # case from a PATH lookup instead.
+    if shutil.which(cmd[0]) is None:
+        return False
     try:
         completed = subprocess.run(
-            cmd, input=b"", check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+            cmd,
+            input=b"",
+            check=False,
+            cwd=cwd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
         )
     except (subprocess.SubprocessError, OSError):
         return False
@@ -2365,38 +2707,39 @@ def _run_sub_process(cmd: List[str], valid_return: Optional[List[int]] = None) -
 def _crop_tuple(size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
     """Return the crop rectangle, as a (left, upper, right, lower)-tuple."""
     width, height = size
-    if width > height:  # landscape
-        left = int((width - height) / 2)
-        upper = 0
-        right = left + height
-        lower = height
-        return (left, upper, right, lower)
-    if height > width:  # portrait
-        left = 0
-        upper = int((height - width) / 2)
-        right = width
-        lower = upper + width
-        return (left, upper, right, lower)
-
-    # cube
-    return None
+    diff = width - height
+    if not diff:  # cube
+        return None
+    # One arithmetic path covers landscape and portrait: exactly one of
+    # the two offsets is non-zero, and integer shifts replace the float
+    # division round trip.
+    left = max(diff, 0) >> 1
+    upper = max(-diff, 0) >> 1
+    side = min(width, height)
+    return (left, upper, left + side, upper + side)
 
 
+@lru_cache(maxsize=65536)
 def make_hash(to_hash: str) -> str:
     """Return a hash of to_hash."""
-    hash_obj = hashlib.md5()
-    hash_obj.update(to_hash.encode("utf-8"))
-    hash_code = str(hash_obj.hexdigest())
-    return hash_code
+    # The hash only identifies a path, it has no security purpose.
+    # blake2b is the fastest hash in hashlib, and a 16 byte digest
+    # keeps the hex length identical to the old md5 based hashes.
+    hash_obj = hashlib.blake2b(to_hash.encode("utf-8"), digest_size=16)
+    # digest().hex() goes straight through the C implementation; the old
+    # str(hexdigest()) additionally re-wrapped an already-str value.
+    return hash_obj.digest().hex()
 
 
 def multi_urljoin(*parts: str) -> str:
     """Join multiple url parts into a valid url."""
+    # Feed join a list instead of a generator; str.join over a list of
+    # str takes CPython's fast path without an extra size-probing pass.
     if parts[0].startswith("http"):
         return str(
             urljoin(
                 parts[0],
-                "/".join(part.strip("/") for part in parts[1:]),
+                "/".join([part.strip("/") for part in parts[1:]]),
             )
         )
-    return "/" + "/".join(part.strip("/") for part in parts if part)
+    return "/" + "/".join([part.strip("/") for part in parts if part])
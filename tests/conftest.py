@@ -5,11 +5,19 @@ import pytest
 from fastapi.testclient import TestClient
 
 from imjoy_elfinder.app import build_app
+from imjoy_elfinder.elfinder import Connector
 from imjoy_elfinder.settings import Settings
 
 from . import ROOT_PATH, RequestParams, TEST_CONTENT, ZIP_FILE
 
 
+@pytest.fixture(autouse=True)
+def reset_archivers_cache():
+    """Reset the process-wide archiver detection cache between tests."""
+    Connector._archivers_detected = None  # pylint: disable=protected-access
+    yield
+
+
 @pytest.fixture(name="request_params")
 def request_params_fixture():
     """Return a client request parameters instance."""
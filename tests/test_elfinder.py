@@ -1,5 +1,6 @@
 """Test elfinder."""
-import subprocess
+import io
+import tarfile
 from contextlib import ExitStack as default_context
 from pathlib import Path
 from unittest.mock import patch
@@ -27,9 +28,9 @@ from imjoy_elfinder.api_const import (
     R_UPLMAXFILE,
     R_UPLMAXSIZE,
 )
-from imjoy_elfinder.elfinder import make_hash
+from imjoy_elfinder.elfinder import _extract_stdlib, make_hash
 
-from . import ZIP_FILE, ZIP_FILE_ASCII_CONTENT
+from . import TEST_CONTENT, ZIP_FILE, ZIP_FILE_ASCII_CONTENT
 
 # pylint: disable=too-many-arguments
 
@@ -103,24 +104,6 @@ def update_settings(settings, updates, files):
     return settings
 
 
-def raise_subprocess_after_check_archivers():
-    """Return a mock subprocess.run function."""
-    programs = set()
-    orig_subprocess_run = subprocess.run
-
-    def mock_subprocess_run(args, **kwargs):
-        """Raise the second time a program is called."""
-        prog = args[0]
-        if prog in programs:
-            raise OSError("Boom")
-        programs.add(prog)
-        return orig_subprocess_run(  # pylint: disable=subprocess-run-check
-            args, **kwargs
-        )
-
-    return mock_subprocess_run
-
-
 @pytest.mark.parametrize(
     "error, root, command, access, context",
     [
@@ -624,9 +607,7 @@ def test_duplicate(
             "zip_file",
             None,
             None,
-            patch(
-                "subprocess.run", side_effect=raise_subprocess_after_check_archivers()
-            ),
+            patch("subprocess.run", side_effect=OSError("Boom")),
         ),
     ],
     indirect=["access"],
@@ -648,6 +629,79 @@ def test_extract(
     assert (R_ADDED in body) is added
 
 
+def test_archive_stdlib(client, request_params, hashed_files, txt_file):
+    """Test the archive command without external archiver binaries."""
+    request_params.params[API_CMD] = "archive"
+    params = {
+        API_TYPE: "application/x-tar",
+        API_TARGET: "txt_file_parent",
+        API_TARGETS: "txt_file",
+    }
+    request_params = update_params(request_params, params, hashed_files)
+
+    with patch("imjoy_elfinder.elfinder.shutil.which", return_value=None):
+        # The archive command relies on the archivers registered by a
+        # previous open command, so prime the detection first.
+        client.post("/connector", params={API_CMD: "open", API_INIT: "1"})
+        response = client.post("/connector", params=request_params.params)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body.get(R_ERROR) is None
+    assert R_ADDED in body
+    archive_path = txt_file.parent / "test.txt.tar"
+    assert archive_path.exists()
+    with tarfile.open(archive_path) as tar_fil:
+        assert tar_fil.getnames() == ["test.txt"]
+
+
+def test_extract_stdlib(client, request_params, hashed_files, txt_file):
+    """Test the extract command without external archiver binaries."""
+    archive_path = txt_file.parent / "inner.tar"
+    with tarfile.open(archive_path, "w") as tar_fil:
+        tar_fil.add(str(txt_file), arcname="hello.txt")
+    request_params.params[API_CMD] = "extract"
+    params = {API_TARGET: make_hash(str(archive_path)), API_MAKEDIR: "1"}
+    request_params = update_params(request_params, params, hashed_files)
+
+    with patch("imjoy_elfinder.elfinder.shutil.which", return_value=None):
+        response = client.post("/connector", params=request_params.params)
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body.get(R_ERROR) is None
+    assert R_ADDED in body
+    extracted = txt_file.parent / "inner" / "hello.txt"
+    assert extracted.read_text() == TEST_CONTENT
+
+
+@pytest.mark.parametrize(
+    "member_name, link_name",
+    [
+        ("../evil.txt", None),  # Relative traversal
+        ("/abs/evil.txt", None),  # Absolute member
+        ("evil_link", "../../outside"),  # Symlink escaping the target
+    ],
+)
+def test_extract_stdlib_rejects_traversal(member_name, link_name, tmp_path):
+    """Test that in-process extraction refuses members outside the target."""
+    archive_path = tmp_path / "evil.tar"
+    with tarfile.open(archive_path, "w") as tar_fil:
+        info = tarfile.TarInfo(member_name)
+        if link_name is not None:
+            info.type = tarfile.SYMTYPE
+            info.linkname = link_name
+        else:
+            info.size = 4
+        tar_fil.addfile(info, io.BytesIO(b"boom"))
+    target_dir = tmp_path / "target"
+    target_dir.mkdir()
+
+    assert _extract_stdlib(str(archive_path), str(target_dir)) is False
+    assert not list(target_dir.iterdir())
+    assert not (tmp_path / "evil.txt").exists()
+
+
 @pytest.mark.parametrize(
     "text, status, content_type, content_disp, content_length, "
     "target, download, access, context",